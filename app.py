@@ -1,12 +1,26 @@
+import array
+import atexit
+import concurrent.futures
+import ctypes
 import math
+import os
+import threading
 import time
 import uuid
 from dataclasses import dataclass
-from typing import Any, Dict, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
 
+import numpy as np
+import orjson
+import pygeohash
+from numba import njit, prange
 import firebase_admin
+from cachetools import TTLCache
 from firebase_admin import credentials, firestore
-from flask import Flask, jsonify, render_template, request
+from google.api_core import exceptions as gcp_exceptions
+from google.api_core.retry import Retry
+from flask import Flask, render_template, request
 
 # --- Application Setup ---
 app = Flask(__name__)
@@ -18,115 +32,475 @@ class Coords:
     lat: float
     lon: float
 
+# --- Shared Executor ---
+# One pool for every Firestore fan-out, created once so requests don't pay
+# thread-spawn cost; 40 workers keeps us well under Firestore's write ceiling.
+EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=40, thread_name_prefix='fs')
+atexit.register(EXECUTOR.shutdown)
+
+# --- Geohash Settings ---
+# Precision stored on each user document (~1.2 km x 0.6 km cells).
+GEOHASH_PRECISION = 6
+# Coarser precision used as the query prefix (~5 km x 5 km cells).
+GEOHASH_QUERY_PRECISION = 5
+
+# Users whose last ping is older than this are not offered as partners, even
+# if a crashed client left their status stuck at 'online'.
+ONLINE_FRESHNESS_SECONDS = 90
+
+# Any candidate inside this radius is "good enough": the scan stops early
+# instead of ranking every remaining candidate.
+ACCEPT_THRESHOLD_KM = float(os.environ.get('ACCEPT_THRESHOLD_KM', '0.5'))
+
+# --- gRPC Channel Tuning ---
+# Keepalives stop idle channels being torn down between polling bursts, and
+# more concurrent HTTP/2 streams keep RPCs from queueing on one connection.
+GRPC_CHANNEL_OPTIONS = [
+    ('grpc.keepalive_time_ms', 30000),
+    ('grpc.keepalive_timeout_ms', 10000),
+    ('grpc.http2.max_pings_without_data', 0),
+    ('grpc.max_concurrent_streams', 1000),
+]
+
 # --- Service Managers ---
 class FirestoreManager:
     """Handles all interactions with the Firestore database."""
     def __init__(self):
         """Initializes the Firestore client and handles credentials."""
+        # Short-lived read cache that absorbs the client polling bursts on
+        # /check-status and /get-partner-location.
+        self._user_cache = TTLCache(maxsize=10000, ttl=2.0)
+        self._cache_lock = threading.Lock()
+        # Coalescing buffer for location pings; only the newest update per
+        # user survives until the periodic flush commits them in batches.
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._pending_lock = threading.Lock()
         try:
             # It's recommended to use environment variables for credentials in production
             cred = credentials.Certificate("serviceAccountKey.json")
             if not firebase_admin._apps:
                 firebase_admin.initialize_app(cred)
             self.db = firestore.client()
+            self._tune_grpc_channel()
+            # Cache the collection reference so every call doesn't rebuild it.
+            self._users = self.db.collection('users')
             app.logger.info("✅ Firebase connection successful.")
         except Exception as e:
             app.logger.error(f"🔥 Firebase connection failed: {e}")
             self.db = None
+            self._users = None
+
+    def _tune_grpc_channel(self) -> None:
+        """Rebuilds the client's gRPC transport with GRPC_CHANNEL_OPTIONS.
+
+        The default channel has no keepalive and a small concurrent-stream
+        budget; under load every Firestore RPC queues on it. Best-effort: if
+        the client internals change, the stock transport is kept.
+        """
+        try:
+            from google.cloud.firestore_v1.services.firestore.client import FirestoreClient
+            from google.cloud.firestore_v1.services.firestore.transports.grpc import (
+                FirestoreGrpcTransport,
+            )
+
+            channel = FirestoreGrpcTransport.create_channel(
+                credentials=self.db._credentials,
+                options=GRPC_CHANNEL_OPTIONS,
+            )
+            transport = FirestoreGrpcTransport(channel=channel)
+            self.db._firestore_api_internal = FirestoreClient(transport=transport)
+        except Exception as e:
+            app.logger.warning(f"gRPC channel tuning skipped: {e}")
 
     def is_active(self) -> bool:
         """Checks if the database client is initialized."""
         return self.db is not None
 
     def update_user_location(self, user_id: str, status: str, coords: Coords) -> None:
-        """Sets or updates a user's status, location, and last seen timestamp."""
-        user_ref = self.db.collection('users').document(user_id)
-        user_ref.set({
+        """Queues a user's status, location, and last-seen update for flush.
+
+        Pings from all users within one flush window share a batched commit
+        (only the newest update per user survives), so each /update-location
+        call returns without paying its own write RPC.
+        """
+        payload = {
             'status': status,
             'location': firestore.GeoPoint(coords.lat, coords.lon),
-            'lastSeen': time.time()
-        }, merge=True)
+            'geohash': pygeohash.encode(coords.lat, coords.lon, precision=GEOHASH_PRECISION),
+            # Stamped on commit by Firestore: no client clock skew, and the
+            # field can carry a server-side TTL policy (see cleanup note).
+            'lastSeen': firestore.SERVER_TIMESTAMP
+        }
+        with self._pending_lock:
+            self._pending[user_id] = payload
+        self._invalidate_cache(user_id)
+
+    def _discard_pending(self, *user_ids: str) -> None:
+        """Drops buffered pings for users about to receive a direct write.
+
+        A buffered pre-match payload flushing after e.g. create_match would
+        merge its stale status back over the fresh one; the dropped ping
+        costs nothing since the client sends another within a second.
+        """
+        with self._pending_lock:
+            for user_id in user_ids:
+                self._pending.pop(user_id, None)
+
+    def flush_location_updates(self) -> None:
+        """Commits all buffered location updates in concurrent batches."""
+        with self._pending_lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+
+        items = list(pending.items())
+        chunks = [items[start:start + 450] for start in range(0, len(items), 450)]
+
+        def commit_chunk(chunk) -> None:
+            batch = self.db.batch()
+            for buffered_id, payload in chunk:
+                batch.set(self._users.document(buffered_id), payload, merge=True)
+            batch.commit(retry=Retry())
+
+        list(EXECUTOR.map(commit_chunk, chunks))
+        # Reads during the pre-flush window re-cache the old document, so
+        # drop those entries again now that the new state is committed.
+        self._invalidate_cache(*pending)
+
+    def _invalidate_cache(self, *user_ids: str) -> None:
+        """Drops cached reads for users whose documents were just written."""
+        with self._cache_lock:
+            for user_id in user_ids:
+                self._user_cache.pop(user_id, None)
 
     def get_user_data(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Retrieves a user's document data by their ID."""
-        doc = self.db.collection('users').document(user_id).get()
-        return doc.to_dict() if doc.exists else None
+        with self._cache_lock:
+            if user_id in self._user_cache:
+                cached = self._user_cache[user_id]
+                # Hand out a copy so route-level mutations (e.g. adding
+                # partnerLocation) never leak into the shared cache entry.
+                return dict(cached) if cached is not None else None
+        doc = self._users.document(user_id).get()
+        data = _normalize(doc.to_dict()) if doc.exists else None
+        with self._cache_lock:
+            self._user_cache[user_id] = data
+        return dict(data) if data is not None else None
+
+    def get_users_bulk(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Retrieves multiple user documents in a single batched read RPC."""
+        refs = [self._users.document(user_id) for user_id in ids]
+        result = {doc.id: _normalize(doc.to_dict()) for doc in self.db.get_all(refs) if doc.exists}
+        with self._cache_lock:
+            # Cache copies; the returned dicts may be mutated by callers.
+            self._user_cache.update((uid, dict(data)) for uid, data in result.items())
+        return result
 
     def find_closest_online_partner(self, user_id: str, user_coords: Coords) -> Optional[Dict[str, Any]]:
         """Finds the nearest available user with 'online' status."""
-        self.cleanup_stale_users()
-        users_ref = self.db.collection('users')
-        # Query for users who are online, excluding the current user.
-        query = users_ref.where('status', '==', 'online').limit(50)
-        online_users = [doc for doc in query.stream() if doc.id != user_id]
+        users_ref = self._users
+        fresh_cutoff = datetime.now(timezone.utc) - timedelta(seconds=ONLINE_FRESHNESS_SECONDS)
+        # Candidates are laid out structure-of-arrays style in one streaming
+        # pass: a list of ids plus two packed float64 coordinate buffers that
+        # feed the vectorized haversine directly, instead of holding snapshot
+        # objects and re-dereferencing GeoPoint attributes later.
+        ids: List[str] = []
+        lats = array.array('d')
+        lons = array.array('d')
+        seen_ids = set()
+        # Scalar distance for the per-candidate early-accept checks below;
+        # origin-specialized, and backed by the C kernel when built.
+        dist_km = haversine_from(user_coords)
 
-        if not online_users:
+        # Restrict the query to the caller's geohash cell and its 8 neighbors,
+        # so only geographically-near documents are fetched from Firestore.
+        # The geohash range already uses this query's one allowed inequality
+        # field, so the freshness cutoff is applied client-side here.
+        try:
+            for cell in geohash_query_cells(user_coords):
+                cell_query = (users_ref.where('status', '==', 'online')
+                              .where('geohash', '>=', cell)
+                              .where('geohash', '<', cell + '~')
+                              .select(['location', 'lastSeen'])
+                              .limit(50))
+                for doc in cell_query.stream():
+                    # DocumentSnapshot.get raises KeyError for fields absent
+                    # from the (projected) snapshot, so read via to_dict().
+                    fields = doc.to_dict()
+                    last_seen = fields.get('lastSeen')
+                    if (doc.id == user_id or doc.id in seen_ids
+                            or last_seen is None or last_seen <= fresh_cutoff):
+                        continue
+                    loc = fields.get('location')
+                    if loc:
+                        # Anyone inside the accept radius is good enough; stop
+                        # scanning instead of ranking every remaining candidate.
+                        # Cells are fetched caller's-cell-first, so early hits
+                        # are genuinely nearby.
+                        if dist_km(loc.latitude, loc.longitude) < ACCEPT_THRESHOLD_KM:
+                            return {'id': doc.id, 'data': {'location': loc}}
+                        seen_ids.add(doc.id)
+                        ids.append(doc.id)
+                        lats.append(loc.latitude)
+                        lons.append(loc.longitude)
+        except gcp_exceptions.FailedPrecondition as e:
+            # The composite (status, geohash) index hasn't been deployed
+            # (see firestore.indexes.json); degrade to the scans below.
+            app.logger.warning(f"Geohash cell query missing its index, falling back: {e}")
+            ids, lats, lons = [], array.array('d'), array.array('d')
+
+        if not ids:
+            # Fall back to the old full scan, e.g. for documents written
+            # before the geohash field existed. Here the freshness filter can
+            # ride the composite (status, lastSeen) index server-side.
+            try:
+                query = (users_ref.where('status', '==', 'online')
+                         .where('lastSeen', '>', fresh_cutoff)
+                         .select(['location'])
+                         .limit(50))
+                fallback_docs = list(query.stream())
+            except gcp_exceptions.FailedPrecondition as e:
+                # Missing (status, lastSeen) index: the equality-only query
+                # needs no composite index and always works.
+                app.logger.warning(f"Freshness scan missing its index, falling back: {e}")
+                query = (users_ref.where('status', '==', 'online')
+                         .select(['location'])
+                         .limit(50))
+                fallback_docs = list(query.stream())
+            for doc in fallback_docs:
+                if doc.id == user_id:
+                    continue
+                loc = doc.to_dict().get('location')
+                if loc:
+                    if dist_km(loc.latitude, loc.longitude) < ACCEPT_THRESHOLD_KM:
+                        return {'id': doc.id, 'data': {'location': loc}}
+                    ids.append(doc.id)
+                    lats.append(loc.latitude)
+                    lons.append(loc.longitude)
+
+        if not ids:
             return None
 
-        closest_partner = None
-        min_distance = float('inf')
+        lats_np = np.frombuffer(lats, dtype=np.float64)
+        lons_np = np.frombuffer(lons, dtype=np.float64)
+        distances = haversine_np(user_coords.lat, user_coords.lon, lats_np, lons_np)
 
-        for partner_doc in online_users:
-            partner_data = partner_doc.to_dict()
-            loc = partner_data.get('location')
-            if loc:
-                distance = haversine_distance(user_coords, Coords(loc.latitude, loc.longitude))
-                if distance < min_distance:
-                    min_distance = distance
-                    closest_partner = {'id': partner_doc.id, 'data': partner_data}
-        return closest_partner
+        closest = int(np.argmin(distances))
+        closest_loc = firestore.GeoPoint(lats_np[closest], lons_np[closest])
+        return {'id': ids[closest], 'data': {'location': closest_loc}}
 
     def create_match(self, user_id: str, partner_id: str) -> None:
         """Atomically updates both users to a 'matched' status using a batch write."""
+        self._discard_pending(user_id, partner_id)
         batch = self.db.batch()
-        user_ref = self.db.collection('users').document(user_id)
-        partner_ref = self.db.collection('users').document(partner_id)
+        user_ref = self._users.document(user_id)
+        partner_ref = self._users.document(partner_id)
         
         match_data = {'status': 'matched'}
         batch.update(user_ref, {**match_data, 'partnerId': partner_id})
         batch.update(partner_ref, {**match_data, 'partnerId': user_id})
         batch.commit()
+        self._invalidate_cache(user_id, partner_id)
+
+    def _update_parallel(self, updates: List[tuple]) -> None:
+        """Applies independent (ref, fields) updates concurrently, non-atomically."""
+        futures = [EXECUTOR.submit(ref.update, fields) for ref, fields in updates]
+        for future in futures:
+            future.result()
 
     def end_match(self, user_id: str, partner_id: str) -> None:
-        """Atomically removes match data for both users and sets them to 'offline'."""
-        batch = self.db.batch()
-        user_ref = self.db.collection('users').document(user_id)
-        partner_ref = self.db.collection('users').document(partner_id)
-        
+        """Removes match data for both users and sets them to 'offline'.
+
+        Unlike create_match, a transient half-ended state is harmless, so the
+        two independent writes go out in parallel instead of one serialized
+        batch RPC.
+        """
+        self._discard_pending(user_id, partner_id)
         offline_data = {'status': 'offline', 'partnerId': firestore.DELETE_FIELD}
-        batch.update(user_ref, offline_data)
-        batch.update(partner_ref, offline_data)
-        batch.commit()
+        self._update_parallel([
+            (self._users.document(user_id), offline_data),
+            (self._users.document(partner_id), offline_data),
+        ])
+        self._invalidate_cache(user_id, partner_id)
     
     def set_user_status(self, user_id: str, status: str) -> None:
         """Sets a user's status field (e.g., to 'ringing')."""
-        user_ref = self.db.collection('users').document(user_id)
+        self._discard_pending(user_id)
+        user_ref = self._users.document(user_id)
         user_ref.update({'status': status})
+        self._invalidate_cache(user_id)
 
     def cleanup_stale_users(self, expiry_seconds: int = 300) -> None:
-        """Deletes user documents that haven't been updated recently."""
-        stale_threshold = time.time() - expiry_seconds
-        stale_users = self.db.collection('users').where('lastSeen', '<', stale_threshold).stream()
-        deleted_count = 0
-        for user in stale_users:
-            user.reference.delete()
-            deleted_count += 1
-        if deleted_count > 0:
-            app.logger.info(f"Cleaned up {deleted_count} stale users.")
+        """Deletes user documents that haven't been updated recently.
+
+        With a Firestore TTL policy configured on `lastSeen`, the server
+        expires stale documents on its own; this remains as a safety net.
+        """
+        stale_threshold = datetime.now(timezone.utc) - timedelta(seconds=expiry_seconds)
+        stale_users = self._users.where('lastSeen', '<', stale_threshold).stream()
+        refs = [user.reference for user in stale_users]
+        # Documents from before the SERVER_TIMESTAMP change hold float
+        # lastSeen values, which Firestore orders below all timestamps: the
+        # query above and the TTL policy both skip them forever. Sweep them
+        # with a numeric-typed threshold (matches only legacy floats).
+        legacy_users = self._users.where('lastSeen', '<', time.time() - expiry_seconds).stream()
+        refs += [user.reference for user in legacy_users]
+        if not refs:
+            return
+        # Firestore caps a WriteBatch at 500 operations; stay safely under it
+        # and commit the chunks concurrently instead of one after another.
+        chunks = [refs[start:start + 450] for start in range(0, len(refs), 450)]
+
+        def commit_chunk(chunk) -> None:
+            batch = self.db.batch()
+            for ref in chunk:
+                batch.delete(ref)
+            batch.commit(retry=Retry())
+
+        list(EXECUTOR.map(commit_chunk, chunks))
+        app.logger.info(f"Cleaned up {len(refs)} stale users.")
 
 # --- Globals & Helpers ---
+def _normalize(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Converts Firestore value types into JSON-ready Python values.
+
+    GeoPoints become plain dicts and timestamps become epoch floats (the
+    shape lastSeen had before SERVER_TIMESTAMP; orjson also rejects
+    Firestore's datetime subclass). Applied once at the read boundary so
+    routes never type-check fields.
+    """
+    for key, value in data.items():
+        if isinstance(value, firestore.GeoPoint):
+            data[key] = {'latitude': value.latitude, 'longitude': value.longitude}
+        elif isinstance(value, datetime):
+            data[key] = value.timestamp()
+    return data
+
 db_manager = FirestoreManager()
 
+def _cleanup_loop(interval_seconds: int = 3600) -> None:
+    """Runs the stale-user cleanup periodically, off the request path.
+
+    Hourly is enough: the Firestore TTL policy on `lastSeen` does the real
+    expiry, and the freshness filter hides stale users from matching anyway.
+    """
+    while True:
+        time.sleep(interval_seconds)
+        try:
+            db_manager.cleanup_stale_users()
+        except Exception as e:
+            app.logger.error(f"Stale-user cleanup failed: {e}")
+
+def _location_flush_loop(interval_seconds: float = 0.2) -> None:
+    """Flushes the coalesced location-update buffer on a short cadence."""
+    while True:
+        time.sleep(interval_seconds)
+        try:
+            db_manager.flush_location_updates()
+        except Exception as e:
+            app.logger.error(f"Location flush failed: {e}")
+
+if db_manager.is_active():
+    threading.Thread(target=_cleanup_loop, name='stale-cleanup', daemon=True).start()
+    threading.Thread(target=_location_flush_loop, name='location-flush', daemon=True).start()
+
+@njit(cache=True, fastmath=True)
+def _hav_one(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """JIT-compiled haversine for one pair of degree coordinates, in km."""
+    lat1, lon1, lat2, lon2 = math.radians(lat1), math.radians(lon1), math.radians(lat2), math.radians(lon2)
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+@njit(cache=True, parallel=True, fastmath=True)
+def _hav_batch(lat1: float, lon1: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """JIT-compiled, multicore haversine from one point to coordinate arrays."""
+    out = np.empty(lats.size, dtype=np.float64)
+    for i in prange(lats.size):
+        out[i] = _hav_one(lat1, lon1, lats[i], lons[i])
+    return out
+
+def haversine_np(lat1: float, lon1: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Calculates distances in km from one point to arrays of lat/lon coordinates."""
+    return _hav_batch(lat1, lon1, np.ascontiguousarray(lats), np.ascontiguousarray(lons))
+
+# Warm the JIT at import so the first request doesn't pay compilation time.
+haversine_np(0.0, 0.0, np.zeros(1), np.zeros(1))
+
+def geohash_query_cells(coords: Coords) -> list:
+    """Returns the coarse geohash cells covering the point and its 8 neighbors."""
+    center = pygeohash.encode(coords.lat, coords.lon, precision=GEOHASH_QUERY_PRECISION)
+    top = pygeohash.get_adjacent(center, 'top')
+    bottom = pygeohash.get_adjacent(center, 'bottom')
+    cells = {
+        center, top, bottom,
+        pygeohash.get_adjacent(center, 'left'),
+        pygeohash.get_adjacent(center, 'right'),
+        pygeohash.get_adjacent(top, 'left'),
+        pygeohash.get_adjacent(top, 'right'),
+        pygeohash.get_adjacent(bottom, 'left'),
+        pygeohash.get_adjacent(bottom, 'right'),
+    }
+    # Caller's own cell first, so early-exit scans hit the nearest area first.
+    return [center] + sorted(cells - {center})
+
+def haversine_from(origin: Coords):
+    """Returns a km-distance function specialized to a fixed origin.
+
+    Dispatches to the compiled C kernel when _haversine.so has been built;
+    otherwise the origin's radian conversion and cosine are hoisted out of
+    the returned closure, so one-to-many callers don't redo the same trig
+    per candidate.
+    """
+    if _haversine_c is not None:
+        origin_lat, origin_lon = origin.lat, origin.lon
+        return lambda lat, lon: _haversine_c(origin_lat, origin_lon, lat, lon)
+
+    R = 6371  # Earth's radius in km
+    lat1_rad = math.radians(origin.lat)
+    lon1_rad = math.radians(origin.lon)
+    cos_lat1 = math.cos(lat1_rad)
+
+    def distance_km(lat: float, lon: float) -> float:
+        lat2_rad = math.radians(lat)
+        dlat = lat2_rad - lat1_rad
+        dlon = math.radians(lon) - lon1_rad
+        a = math.sin(dlat / 2) ** 2 + cos_lat1 * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2
+        return 2 * R * math.asin(math.sqrt(a))
+
+    return distance_km
+
+def _load_haversine_c():
+    """Loads the compiled single-pair haversine kernel, if it has been built.
+
+    See haversine.c for the source and build command; the pure-Python path
+    below is used when the shared object is absent.
+    """
+    lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '_haversine.so')
+    try:
+        lib = ctypes.CDLL(lib_path)
+    except OSError:
+        return None
+    lib.haversine.argtypes = [ctypes.c_double] * 4
+    lib.haversine.restype = ctypes.c_double
+    return lib.haversine
+
+_haversine_c = _load_haversine_c()
+
 def haversine_distance(c1: Coords, c2: Coords) -> float:
     """Calculates the distance between two lat/lon coordinates in kilometers."""
-    R = 6371  # Earth's radius in km
-    dlat = math.radians(c2.lat - c1.lat)
-    dlon = math.radians(c2.lon - c1.lon)
-    a = (math.sin(dlat / 2) ** 2 +
-         math.cos(math.radians(c1.lat)) * math.cos(math.radians(c2.lat)) *
-         math.sin(dlon / 2) ** 2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
+    if _haversine_c is not None:
+        return _haversine_c(c1.lat, c1.lon, c2.lat, c2.lon)
+    return haversine_from(c1)(c2.lat, c2.lon)
+
+def ojsonify(obj: Any, status: int = 200):
+    """Builds a JSON response via orjson, much faster than stdlib jsonify.
+
+    OPT_SERIALIZE_NUMPY lets NumPy scalars from the vectorized distance path
+    serialize without an explicit cast.
+    """
+    return app.response_class(orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY),
+                              status=status, mimetype='application/json')
 
 # --- Flask Routes ---
 @app.route('/')
@@ -137,106 +511,106 @@ def index():
 @app.route('/update-location', methods=['POST'])
 def update_location():
     """Updates a user's location and status (online, offline, matched)."""
-    if not db_manager.is_active(): return jsonify({'status': 'error', 'message': 'Database not configured'}), 500
+    if not db_manager.is_active(): return ojsonify({'status': 'error', 'message': 'Database not configured'}, 500)
     
     data = request.get_json()
     if not data or not data.get('userId') or not data.get('status'):
-        return jsonify({'status': 'error', 'message': 'Missing required fields: userId, status'}), 400
+        return ojsonify({'status': 'error', 'message': 'Missing required fields: userId, status'}, 400)
 
     coords = Coords(lat=data.get('lat', 0), lon=data.get('lon', 0))
     db_manager.update_user_location(data['userId'], data['status'], coords)
-    return jsonify({'status': 'success'})
+    return ojsonify({'status': 'success'})
 
 @app.route('/find-partner', methods=['POST'])
 def find_partner():
     """Finds the closest available partner and creates a match."""
-    if not db_manager.is_active(): return jsonify({'status': 'error', 'message': 'Database not configured'}), 500
+    if not db_manager.is_active(): return ojsonify({'status': 'error', 'message': 'Database not configured'}, 500)
 
     data = request.get_json()
     if not data or not all(k in data for k in ['userId', 'lat', 'lon']):
-        return jsonify({'status': 'error', 'message': 'Missing required fields: userId, lat, lon'}), 400
+        return ojsonify({'status': 'error', 'message': 'Missing required fields: userId, lat, lon'}, 400)
 
     user_coords = Coords(lat=data['lat'], lon=data['lon'])
     partner = db_manager.find_closest_online_partner(data['userId'], user_coords)
     
     if not partner:
-        return jsonify({'status': 'no_partner_found'})
+        return ojsonify({'status': 'no_partner_found'})
         
     db_manager.create_match(data['userId'], partner['id'])
-    return jsonify({'status': 'matched', 'partnerId': partner['id']})
+    return ojsonify({'status': 'matched', 'partnerId': partner['id']})
 
 @app.route('/ring-partner', methods=['POST'])
 def ring_partner():
     """Sets a partner's status to 'ringing' to notify them."""
-    if not db_manager.is_active(): return jsonify({'status': 'error', 'message': 'Database not configured'}), 500
+    if not db_manager.is_active(): return ojsonify({'status': 'error', 'message': 'Database not configured'}, 500)
     
     data = request.get_json()
     partner_id = data.get('partnerId')
     if not partner_id:
-        return jsonify({'status': 'error', 'message': 'Partner ID is required'}), 400
+        return ojsonify({'status': 'error', 'message': 'Partner ID is required'}, 400)
 
     db_manager.set_user_status(partner_id, 'ringing')
-    return jsonify({'status': 'success', 'message': f"Ringing user {partner_id}"})
+    return ojsonify({'status': 'success', 'message': f"Ringing user {partner_id}"})
 
 @app.route('/check-status', methods=['POST'])
 def check_status():
     """Checks a user's status; includes partner location if matched."""
-    if not db_manager.is_active(): return jsonify({'status': 'error', 'message': 'Database not configured'}), 500
+    if not db_manager.is_active(): return ojsonify({'status': 'error', 'message': 'Database not configured'}, 500)
     
     data = request.get_json()
     user_id = data.get('userId')
     if not user_id:
-        return jsonify({'status': 'error', 'message': 'User ID is required'}), 400
+        return ojsonify({'status': 'error', 'message': 'User ID is required'}, 400)
 
     user_data = db_manager.get_user_data(user_id)
     if not user_data:
-        return jsonify({'status': 'not_found'})
+        return ojsonify({'status': 'not_found'})
     
-    # If matched, embed partner's location to prevent a race condition on the client
+    # If matched, embed partner's location to prevent a race condition on the client.
+    # Both documents are refreshed in one pipelined RPC instead of a second
+    # sequential round-trip.
     if user_data.get('status') == 'matched':
         partner_id = user_data.get('partnerId')
         if partner_id:
-            partner_data = db_manager.get_user_data(partner_id)
+            bulk = db_manager.get_users_bulk([user_id, partner_id])
+            user_data = bulk.get(user_id, user_data)
+            partner_data = bulk.get(partner_id)
             if partner_data and 'location' in partner_data:
                 loc = partner_data['location']
-                user_data['partnerLocation'] = {'lat': loc.latitude, 'lon': loc.longitude}
-        
-    # Serialize GeoPoint for JSON response
-    if 'location' in user_data and isinstance(user_data['location'], firestore.GeoPoint):
-        loc = user_data['location']
-        user_data['location'] = {'latitude': loc.latitude, 'longitude': loc.longitude}
-        
-    return jsonify(user_data)
+                user_data['partnerLocation'] = {'lat': loc['latitude'], 'lon': loc['longitude']}
+
+    return ojsonify(user_data)
 
 @app.route('/get-partner-location', methods=['POST'])
 def get_partner_location():
     """Retrieves the current location of a given partner ID."""
-    if not db_manager.is_active(): return jsonify({'status': 'error', 'message': 'Database not configured'}), 500
+    if not db_manager.is_active(): return ojsonify({'status': 'error', 'message': 'Database not configured'}, 500)
     
     data = request.get_json()
     partner_id = data.get('partnerId')
     if not partner_id:
-        return jsonify({'status': 'error', 'message': 'Partner ID is required'}), 400
+        return ojsonify({'status': 'error', 'message': 'Partner ID is required'}, 400)
 
     partner_data = db_manager.get_user_data(partner_id)
     if not partner_data or 'location' not in partner_data:
-        return jsonify({'status': 'error', 'message': 'Partner location not available'}), 404
+        return ojsonify({'status': 'error', 'message': 'Partner location not available'}, 404)
         
     loc = partner_data['location']
-    return jsonify({'lat': loc.latitude, 'lon': loc.longitude})
+    return ojsonify({'lat': loc['latitude'], 'lon': loc['longitude']})
 
 @app.route('/exit-match', methods=['POST'])
 def exit_match():
     """Ends a match between two users."""
-    if not db_manager.is_active(): return jsonify({'status': 'error', 'message': 'Database not configured'}), 500
+    if not db_manager.is_active(): return ojsonify({'status': 'error', 'message': 'Database not configured'}, 500)
     
     data = request.get_json()
     if not data or not all(k in data for k in ['userId', 'partnerId']):
-        return jsonify({'status': 'error', 'message': 'Missing required fields: userId, partnerId'}), 400
+        return ojsonify({'status': 'error', 'message': 'Missing required fields: userId, partnerId'}, 400)
 
     db_manager.end_match(data['userId'], data['partnerId'])
-    return jsonify({'status': 'success'})
+    return ojsonify({'status': 'success'})
 
 if __name__ == '__main__':
-    # Use host='0.0.0.0' to make the server accessible on your local network
+    # Local debugging only; production serving goes through gunicorn with the
+    # gevent worker (see gunicorn.conf.py).
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
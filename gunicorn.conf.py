@@ -0,0 +1,28 @@
+"""Gunicorn configuration for production serving.
+
+The workload is I/O-bound on Firestore RPCs, so gevent's cooperative green
+threads let many requests wait on the network concurrently per worker.
+Gunicorn's gevent worker monkey-patches the stdlib before the app module
+(and with it firebase_admin) is imported.
+
+Run with: gunicorn app:app
+"""
+import multiprocessing
+
+bind = '0.0.0.0:5000'
+workers = 2 * multiprocessing.cpu_count() + 1
+worker_class = 'gevent'
+worker_connections = 1000
+keepalive = 5
+
+def post_fork(server, worker):
+    """Teaches grpc to yield to gevent before the app (and grpc) is used.
+
+    Monkey-patching alone does not reach grpc's native code: without this,
+    every Firestore RPC blocks the worker's only OS thread, stalling all
+    greenlets and risking a documented gevent+grpc deadlock. post_fork runs
+    in the worker before the WSGI app is imported, so grpc is initialized
+    for gevent ahead of firebase_admin.
+    """
+    import grpc.experimental.gevent as grpc_gevent
+    grpc_gevent.init_gevent()
@@ -0,0 +1,24 @@
+/*
+ * Scalar haversine kernel for the single-pair hot path.
+ *
+ * The whole computation runs in native code with no Python intermediates,
+ * and -ffast-math lets the compiler pair/vectorize the trig calls.
+ *
+ * Build (optional; app.py falls back to pure Python when absent):
+ *   cc -O3 -ffast-math -march=native -shared -fPIC haversine.c -o _haversine.so
+ */
+#define _GNU_SOURCE
+#include <math.h>
+
+double haversine(double lat1, double lon1, double lat2, double lon2)
+{
+    const double rad = M_PI / 180.0;
+    double s1, c1, s2, c2, sdlat, sdlon, a;
+
+    sincos(lat1 * rad, &s1, &c1);
+    sincos(lat2 * rad, &s2, &c2);
+    sdlat = sin((lat2 - lat1) * rad / 2.0);
+    sdlon = sin((lon2 - lon1) * rad / 2.0);
+    a = sdlat * sdlat + c1 * c2 * sdlon * sdlon;
+    return 2.0 * 6371.0 * asin(sqrt(a));
+}